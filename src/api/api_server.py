@@ -1,14 +1,11 @@
 from flask import Flask, request, jsonify
-from src.blockchain.chain import Blockchain
 from src.blockchain.transaction import Transaction
 from src.blockchain.db.repositories import BlockRepository, TransactionRepository
-from src.blockchain.mempool import Mempool
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric import ec
 from src.utils.logger import logger
 
 app = Flask(__name__)
-blockchain = Blockchain()
 
 # Global references
 blockchain = None
@@ -26,8 +23,18 @@ def create_app(blockchain_instance, mempool_instance, network_instance):
 
 app = create_app(blockchain, mempool, p2p_network)
 
+def _node_component(name: str):
+    """Resolve a node component from the running node (app.config['node']), else the module global"""
+    node = app.config.get('node')
+    if node is not None:
+        return getattr(node, name)
+    return globals()[name]
+
 @app.route('/mine', methods=['POST'])
 def mine_block_post():
+    blockchain = _node_component('blockchain')
+    mempool = _node_component('mempool')
+    p2p_network = _node_component('p2p_network')
     transactions = mempool.get_transactions()
     
     if not transactions:
@@ -43,7 +50,9 @@ def mine_block_post():
             password=None,
         )
 
-        new_block = blockchain.add_block(transactions, validator_private_key)
+        # Evict transactions dropped for invalid signatures so the next /mine does not pick them again
+        new_block = blockchain.add_block(transactions, validator_private_key,
+                                         on_rejected=mempool.remove_transactions)
         
         if new_block:
             # Broadcast new block to network
@@ -65,6 +74,7 @@ def mine_block_post():
 
 @app.route('/')
 def home():
+    blockchain = _node_component('blockchain')
     return jsonify({
         'status': 'running',
         'chain_length': len(blockchain.chain),
@@ -74,6 +84,7 @@ def home():
 
 @app.route('/blocks', methods=['GET'])
 def get_blocks():
+    blockchain = _node_component('blockchain')
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     
@@ -123,9 +134,8 @@ def add_transaction():
             data=data.get('data', {})
         )
         
-        # اضافه کردن تراکنش به mempool
-        mempool = Mempool()
-        if mempool.add_transaction(tx):
+        # اضافه کردن تراکنش به mempool مشترک نود
+        if _node_component('mempool').add_transaction(tx):
             return jsonify({
                 'status': 'success',
                 'tx_hash': tx.tx_hash
@@ -96,7 +96,11 @@ class Block:
         if self.previous_hash != previous_block.hash:
             logger.error(f"Previous hash mismatch: {self.previous_hash} vs {previous_block.hash}")
             return False
-            
+
+        return self.verify_contents()
+
+    def verify_contents(self) -> bool:
+        """Validate hash, signature and transactions (checks that need no previous block)"""
         if self.hash != self.calculate_hash():
             logger.error(f"Block hash invalid: {self.hash} vs {self.calculate_hash()}")
             return False
@@ -1,5 +1,6 @@
 import time
-from typing import List, Optional
+from collections.abc import Sequence
+from typing import Callable, Iterator, List, Optional, Tuple
 from src.blockchain.block import Block
 from src.blockchain.transaction import Transaction
 from src.blockchain.consensus.consensus import Consensus
@@ -7,15 +8,54 @@ from src.blockchain.db.repositories import BlockRepository, TransactionRepositor
 from src.blockchain.consensus.validator_registry import ValidatorRegistry
 from src.blockchain.contracts.vm import SmartContractVM
 from src.blockchain.db.state_db import StateDB
+from src.utils.database import db_connection
 from src.utils.logger import logger
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives import serialization
 
+class ChainView(Sequence):
+    """نمای فقط‌خواندنی زنجیره که بلاک‌ها را در صورت نیاز از دیتابیس می‌خواند"""
+
+    def __init__(self, blockchain: 'Blockchain'):
+        self._blockchain = blockchain
+
+    def __len__(self) -> int:
+        return self._blockchain._height
+
+    def __getitem__(self, item):
+        height = len(self)
+        if isinstance(item, slice):
+            # بازه به صورت صعودی خوانده و سپس گام (حتی منفی) روی آن اعمال می‌شود
+            indices = range(height)[item]
+            if not indices:
+                return []
+            low, high = min(indices), max(indices) + 1
+            blocks = list(BlockRepository.iter_range(low, high))
+            return [blocks[i - low] for i in indices]
+
+        if item < 0:
+            item += height
+        if not 0 <= item < height:
+            raise IndexError("chain index out of range")
+        if item == height - 1:
+            return self._blockchain._tip
+        return next(BlockRepository.iter_range(item, item + 1))
+
+    def __iter__(self) -> Iterator[Block]:
+        return BlockRepository.iter_range(0, len(self))
+
+
 class Blockchain:
     def __init__(self, difficulty: int = 4):
         self.difficulty = difficulty
-        self.chain = []
+        # فقط آخرین بلاک و ارتفاع زنجیره در حافظه نگه داشته می‌شود
+        self._tip: Optional[Block] = None
+        self._height = 0
+        # مجموع difficulty تمام بلاک‌های زنجیره که همراه با tip به‌روز نگه داشته می‌شود
+        self._cum_difficulty = 0
         self.p2p_network = None
+        # (تعداد بلاک‌های اعتبارسنجی شده، هش آخرین آن‌ها)
+        self._validated_upto: Tuple[int, str] = (0, "")
 
         if not hasattr(self, '_db_initialized'):
             try:
@@ -26,15 +66,19 @@ class Blockchain:
                 logger.error(f"Database initialization failed: {e}")
                 raise
 
-        self.chain = self.load_chain()
-        if not self.chain:
+        if not self.load_chain():
             logger.info("No valid chain found, initializing new blockchain")
             self._initialize_new_chain()
-        elif not Consensus.is_chain_valid(self.chain):
+        elif not self.is_chain_valid():
             logger.warning("Invalid chain detected, resetting database...")
             self._reset_blockchain()
             self._initialize_new_chain()
 
+    @property
+    def chain(self) -> ChainView:
+        """بلاک‌های زنجیره که به صورت تنبل از دیتابیس خوانده می‌شوند"""
+        return ChainView(self)
+
     def set_p2p_network(self, p2p_network):
         """Set P2P network reference after initialization"""
         self.p2p_network = p2p_network
@@ -45,7 +89,10 @@ class Blockchain:
         try:
             # ایجاد بلاک جنسیس
             genesis_block = self._create_genesis_block()
-            self.chain = [genesis_block]
+            self._tip = genesis_block
+            self._height = 1
+            self._cum_difficulty = genesis_block.difficulty
+            self._validated_upto = (1, genesis_block.hash)
             logger.info("New blockchain initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize new chain: {e}")
@@ -91,54 +138,102 @@ class Blockchain:
         
         # ذخیره در دیتابیس
         try:
-            block_id = BlockRepository.save_block(genesis_block)
-            TransactionRepository.save_transaction(genesis_tx, block_id)
+            self._persist_block(genesis_block)
             logger.info(f"Genesis block created with hash: {genesis_block.hash}")
             return genesis_block
         except Exception as e:
             logger.error(f"Failed to save genesis block: {e}")
             raise
 
-    def load_chain(self) -> List[Block]:
-        """بارگذاری زنجیره از دیتابیس"""
-        chain = []
-        block_count = BlockRepository.get_block_count()
-        
-        for index in range(block_count):
-            block = BlockRepository.get_block_by_index(index)
-            if not block:
-                logger.error(f"Invalid block at index {index}")
-                return []
-                
-            chain.append(block)
-        
+    def load_chain(self) -> bool:
+        """بارگذاری و اعتبارسنجی جریانی زنجیره از دیتابیس
+
+        بلاک‌ها هنگام اعتبارسنجی از دیتابیس خوانده می‌شوند و فقط آخرین
+        بلاک و ارتفاع زنجیره در حافظه می‌ماند.
+        """
+        tip = None
+        height = 0
+        cum_difficulty = 0
+
+        def track(blocks: Iterator[Block]) -> Iterator[Block]:
+            nonlocal tip, height, cum_difficulty
+            for block in blocks:
+                tip = block
+                height += 1
+                cum_difficulty += block.difficulty
+                yield block
+
         # اعتبارسنجی زنجیره بارگذاری شده
-        if not chain or not Consensus.is_chain_valid(chain):
+        if not Consensus.verify_blocks_parallel(track(BlockRepository.iter_all_blocks())):
             logger.error("Loaded chain is invalid")
-            return []
-            
-        logger.info(f"Successfully loaded chain with {len(chain)} blocks")
-        return chain
+            return False
+
+        self._tip = tip
+        self._height = height
+        self._cum_difficulty = cum_difficulty
+        self._validated_upto = (height, tip.hash)
+        logger.info(f"Successfully loaded chain with {height} blocks")
+        return True
+
     def add_block(self, transactions: List[Transaction], 
                  validator_private_key: ec.EllipticCurvePrivateKey = None,
-                 external_block: Block = None) -> Optional[Block]:
+                 external_block: Block = None,
+                 on_rejected: Optional[Callable[[List[str]], None]] = None) -> Optional[Block]:
         """
         اضافه کردن بلاک جدید به زنجیره
         - اگر external_block ارائه شده باشد، بلاک از شبکه دریافت شده است
         - در غیر این صورت، بلاک محلی ایجاد می‌شود
+        - on_rejected با هش تراکنش‌هایی که به دلیل امضای نامعتبر کنار گذاشته شدند
+          فراخوانی می‌شود تا فراخواننده آن‌ها را از mempool حذف کند
         """
         # حالت 1: بلاک از شبکه دریافت شده است
         if external_block:
             return self._add_external_block(external_block)
-        
+
+        # حالت 2: ایجاد بلاک جدید محلی
+        new_block = self._create_new_block(transactions, validator_private_key, on_rejected)
+
         if new_block:
             if hasattr(self, 'p2p_network') and self.p2p_network:
                 self.p2p_network.broadcast_block(new_block)
-        
+
         return new_block
-            
-        # حالت 2: ایجاد بلاک جدید محلی
-        return self._create_new_block(transactions, validator_private_key)
+
+    def _persist_block(self, block: Block) -> int:
+        """ذخیره بلاک و تراکنش‌هایش به صورت اتمیک در یک تراکنش دیتابیس"""
+        with db_connection() as conn:
+            conn.execute('BEGIN')
+            block_id = BlockRepository.save_block(block, conn)
+            TransactionRepository.save_transactions_bulk(block.transactions, block_id, conn)
+            conn.commit()
+            return block_id
+
+    def _append_tip(self, block: Block):
+        """ثبت بلاک ذخیره شده به عنوان آخرین بلاک زنجیره"""
+        self._tip = block
+        self._height += 1
+        self._cum_difficulty += block.difficulty
+
+    def _replace_chain(self, new_blocks: List[Block], start: int):
+        """جایگزینی بلاک‌های index >= start در دیتابیس با new_blocks به صورت اتمیک"""
+        with db_connection() as conn:
+            conn.execute('BEGIN')
+            removed_difficulty = BlockRepository.get_difficulty_sum(start, conn)
+            BlockRepository.delete_from_index(start, conn)
+            for block in new_blocks:
+                block_id = BlockRepository.save_block(block, conn)
+                TransactionRepository.save_transactions_bulk(block.transactions, block_id, conn)
+            conn.commit()
+
+        self._height = start + len(new_blocks)
+        self._cum_difficulty += Consensus.cumulative_difficulty(new_blocks) - removed_difficulty
+        if new_blocks:
+            self._tip = new_blocks[-1]
+        else:
+            self._tip = next(BlockRepository.iter_range(start - 1, start), None) if start else None
+
+        if self._validated_upto[0] > start:
+            self._validated_upto = (0, "")
     
     def _add_external_block(self, block: Block) -> Optional[Block]:
         """اضافه کردن بلاک دریافتی از شبکه"""
@@ -190,23 +285,20 @@ class Blockchain:
                     # در یک پیاده‌سازی واقعی، ممکن است بخواهید بلاک را رد کنید
                     # اما در اینجا فقط خطا را ثبت می‌کنیم
         
-        # افزودن بلاک به زنجیره
-        self.chain.append(block)
-        
-        # ذخیره در دیتابیس
+        # ذخیره در دیتابیس و افزودن بلاک به زنجیره
         try:
-            block_id = BlockRepository.save_block(block)
-            TransactionRepository.save_transactions_bulk(block.transactions, block_id)
+            self._persist_block(block)
+            self._append_tip(block)
+            self._advance_validated_marker(block)
             logger.info(f"Block #{block.index} added from network: {block.hash[:10]}...")
             return block
         except Exception as e:
             logger.error(f"Failed to save external block: {e}")
-            # حذف بلاک از زنجیره اگر ذخیره‌سازی ناموفق بود
-            self.chain.pop()
             return None
 
     def _create_new_block(self, transactions: List[Transaction], 
-                         validator_private_key: ec.EllipticCurvePrivateKey) -> Optional[Block]:
+                         validator_private_key: ec.EllipticCurvePrivateKey,
+                         on_rejected: Optional[Callable[[List[str]], None]] = None) -> Optional[Block]:
         """ایجاد و افزودن بلاک جدید محلی"""
         if not transactions:
             logger.warning("Cannot add empty block")
@@ -217,6 +309,18 @@ class Blockchain:
             logger.error("Chain not initialized")
             return None
 
+        # اعتبارسنجی امضای تراکنش‌ها پیش از اجرای قراردادها و ساخت بلاک؛ تراکنش‌های
+        # نامعتبر کنار گذاشته می‌شوند تا یک تراکنش خراب کل بلاک را رد نکند
+        invalid = set(Consensus.find_invalid_transactions(transactions))
+        if invalid:
+            if on_rejected:
+                on_rejected([tx.tx_hash for tx in transactions if tx.tx_hash in invalid])
+            logger.warning(f"Dropping {len(invalid)} transactions with invalid signature")
+            transactions = [tx for tx in transactions if tx.tx_hash not in invalid]
+            if not transactions:
+                logger.warning("No valid transactions to include in block")
+                return None
+
         # اجرای قراردادهای هوشمند
         vm = SmartContractVM(StateDB())
         successful_txs = []
@@ -268,11 +372,11 @@ class Blockchain:
 
         # ذخیره در دیتابیس
         try:
-            block_id = BlockRepository.save_block(new_block)
-            TransactionRepository.save_transactions_bulk(successful_txs, block_id)
-        
+            self._persist_block(new_block)
+
             # افزودن به زنجیره
-            self.chain.append(new_block)
+            self._append_tip(new_block)
+            self._advance_validated_marker(new_block)
             logger.info(f"Block #{new_block.index} added to chain: {new_block.hash[:10]}...")
             return new_block
         except Exception as e:
@@ -281,37 +385,92 @@ class Blockchain:
     
     def get_last_block(self) -> Optional[Block]:
         """دریافت آخرین بلاک زنجیره"""
-        if not self.chain:
-            return None
-        return self.chain[-1]
+        return self._tip
 
-    def is_chain_valid(self) -> bool:
-        """اعتبارسنجی زنجیره فعلی"""
-        return Consensus.is_chain_valid(self.chain)
+    def _advance_validated_marker(self, block: Block):
+        """جابجایی نشانگر اعتبارسنجی روی بلاکی که پیش از افزودن بررسی شده است"""
+        upto, tip_hash = self._validated_upto
+        if upto == self._height - 1 and block.previous_hash == tip_hash:
+            self._validated_upto = (self._height, block.hash)
+
+    def is_chain_valid(self, *, full: bool = False) -> bool:
+        """اعتبارسنجی زنجیره فعلی
+
+        فقط بلاک‌های بعد از آخرین نقطه اعتبارسنجی شده بررسی می‌شوند، مگر
+        اینکه full=True باشد یا زنجیره از آن نقطه تغییر کرده باشد.
+        """
+        upto, tip_hash = self._validated_upto
+        if full or upto > self._height or (upto and self.chain[upto - 1].hash != tip_hash):
+            upto, tip_hash = 0, ""
+
+        if upto == 0:
+            # اعتبارسنجی کامل به صورت جریانی از دیتابیس
+            valid = Consensus.verify_blocks_parallel(self.chain)
+        else:
+            valid = Consensus.is_chain_valid_range(self.chain, upto, tip_hash)
+
+        if not valid:
+            self._validated_upto = (0, "")
+            return False
+
+        self._validated_upto = (self._height, self._tip.hash)
+        return True
+
+    def _common_validated_prefix(self, other_chain: List[Block]) -> int:
+        """طول پیشوند مشترک زنجیره دیگر با بخش اعتبارسنجی شده زنجیره فعلی"""
+        limit = min(self._validated_upto[0], len(other_chain))
+        own_hashes = BlockRepository.get_hashes(0, limit)
+        index = 0
+        while index < limit and other_chain[index].hash == own_hashes[index]:
+            index += 1
+        return index
 
     def resolve_conflicts(self, nodes: List[str]) -> bool:
         """حل تعارضات با نودهای دیگر (طولانی‌ترین زنجیره معتبر)"""
         logger.info("Resolving conflicts with network nodes...")
         
         new_chain = None
-        max_cumulative_diff = Consensus.cumulative_difficulty(self.chain)
         
         # در اینجا معمولاً با نودهای دیگر ارتباط برقرار می‌کنیم
         # برای سادگی، فرض می‌کنیم زنجیره‌های دیگر را دریافت کرده‌ایم
         
         # اگر زنجیره جدیدی با سختی تجمعی بیشتر پیدا شد
-        if new_chain and Consensus.is_chain_valid(new_chain):
-            if Consensus.cumulative_difficulty(new_chain) > max_cumulative_diff:
-                self.chain = new_chain
-                logger.info("Chain replaced with longer valid chain")
-                return True
+        if new_chain and self.replace_chain(new_chain):
+            return True
                 
         logger.info("Current chain remains authoritative")
         return False
 
+    def replace_chain(self, new_chain: List[Block]) -> bool:
+        """جایگزینی زنجیره با زنجیره دریافتی، فقط اگر معتبر باشد و سختی تجمعی بیشتری داشته باشد"""
+        if not new_chain:
+            return False
+
+        if Consensus.cumulative_difficulty(new_chain) <= self._cum_difficulty:
+            logger.info("Received chain does not have more cumulative difficulty")
+            return False
+
+        # بلاک‌های مشترک قبلاً اعتبارسنجی شده‌اند؛ فقط از نقطه انشعاب بررسی می‌شود
+        start = self._common_validated_prefix(new_chain)
+        suffix = new_chain[start:]
+        if start:
+            previous = self.chain[start - 1]
+            valid = Consensus.is_chain_valid_range([previous] + suffix, 1, previous.hash)
+        else:
+            valid = Consensus.is_chain_valid(new_chain)
+
+        if not valid:
+            logger.error("Received chain is invalid")
+            return False
+
+        self._replace_chain(suffix, start)
+        self._validated_upto = (self._height, self._tip.hash)
+        logger.info("Chain replaced with longer valid chain")
+        return True
+
     def get_blocks_paginated(self, page: int = 1, per_page: int = 10) -> List[Block]:
         """دریافت بلاک‌ها به صورت صفحه‌بندی شده"""
         return BlockRepository.get_blocks_paginated(page, per_page)
 
     def __repr__(self) -> str:
-        return f"<Blockchain length={len(self.chain)}, last_block={self.get_last_block()}>"
\ No newline at end of file
+        return f"<Blockchain length={self._height}, last_block={self.get_last_block()}>"
\ No newline at end of file
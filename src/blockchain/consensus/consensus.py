@@ -1,9 +1,114 @@
 # consensus.py
+import multiprocessing
+import os
 import random
-from typing import List, Dict
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain as iter_chain
+from typing import Dict, Iterable, Iterator, List
 from src.utils.logger import logger
+from src.utils.database import register_close_callback
 from src.blockchain.consensus.validator_registry import ValidatorRegistry
 
+# تعداد بلاک‌هایی که هر پروسه در اعتبارسنجی موازی بررسی می‌کند
+VERIFY_SEGMENT_SIZE = 256
+# کمترین تعداد تراکنش که اعتبارسنجی موازی امضاها ارزش راه‌اندازی پروسه‌ها را دارد
+VERIFY_TX_PARALLEL_MIN = 64
+# تعداد تراکنش‌هایی که با هم به یک پروسه فرستاده می‌شوند
+VERIFY_TX_CHUNK_SIZE = 16
+
+def _verify_block_segment(blocks: List['Block']) -> bool:
+    """بررسی هش، امضا و تراکنش‌های یک بخش از زنجیره (در پروسه جداگانه)"""
+    return all(block.verify_contents() for block in blocks)
+
+def _invalid_transaction_hashes(transactions: List['Transaction']) -> List[str]:
+    """هش تراکنش‌هایی از یک دسته که بررسی هش و امضای آن‌ها شکست می‌خورد (در پروسه جداگانه)"""
+    return [tx.tx_hash for tx in transactions if not tx.is_valid()]
+
+# pool پروسه‌های مشترک که در اولین استفاده ساخته و برای تمام اعتبارسنجی‌ها نگه داشته می‌شود
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ProcessPoolExecutor:
+    """دریافت pool مشترک پروسه‌ها یا ساخت آن
+
+    پروسه‌ها با forkserver (یا spawn) ساخته می‌شوند، نه fork: در این لحظه threadهای
+    writer mempool، P2P و Flask در حال اجرا هستند و fork کردن آن‌ها ممکن است روی
+    قفل‌های به ارث رسیده (logging، SQLite) deadlock شود. در هر دو روش ماژول __main__
+    در پروسه‌های جدید دوباره import می‌شود، پس import ماژول‌ها نباید اثر جانبی داشته باشد.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _executor = ProcessPoolExecutor(mp_context=multiprocessing.get_context(method))
+        return _executor
+
+def _discard_executor(executor: ProcessPoolExecutor):
+    """کنار گذاشتن pool خراب تا فراخوانی بعدی pool جدیدی بسازد"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def _shutdown_executor():
+    """توقف pool مشترک و انتظار برای خروج پروسه‌ها تا اتصال‌های آن‌ها به دیتابیس بسته شود"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+register_close_callback(_shutdown_executor)
+
+def _map_in_processes(func, items: Iterable) -> Iterator:
+    """اجرای func روی items در چند پروسه و بازگرداندن نتایج به ترتیب؛ در صورت عدم امکان، اجرای سریال
+
+    items به صورت جریانی مصرف می‌شود و در هر لحظه فقط تعداد محدودی کار در
+    جریان است، پس ورودی‌های بزرگ (مثل کل زنجیره) یکجا در حافظه نمی‌مانند.
+    """
+    items = iter(items)
+    max_pending = 2 * (os.cpu_count() or 1)
+    pending = deque()  # [future, item] کارهایی که نتیجه‌شان هنوز برگردانده نشده
+    executor = None
+    try:
+        executor = _get_executor()
+        for item in items:
+            pending.append([None, item])
+            pending[-1][0] = executor.submit(func, item)
+            if len(pending) >= max_pending:
+                yield pending[0][0].result()
+                pending.popleft()
+
+        while pending:
+            yield pending[0][0].result()
+            pending.popleft()
+        return
+    except (OSError, RuntimeError, BrokenProcessPool) as e:
+        # RuntimeError: pool در حال خاموش شدن (مثلاً هنگام خروج پروسه) کار جدید نمی‌پذیرد
+        logger.warning(f"Parallel verification unavailable, falling back to serial: {e}")
+        if executor is not None:
+            _discard_executor(executor)
+    finally:
+        # با توقف زودهنگام (مثلاً اولین بلاک نامعتبر) کارهای باقی‌مانده لغو می‌شوند
+        for future, _ in pending:
+            if future is not None:
+                future.cancel()
+
+    for item in iter_chain((item for _, item in pending), items):
+        yield func(item)
+
+def _all_in_processes(func, items: Iterable) -> bool:
+    """True اگر func برای تمام items در چند پروسه True برگرداند؛ با اولین شکست متوقف می‌شود"""
+    results = _map_in_processes(func, items)
+    try:
+        return all(results)
+    finally:
+        results.close()
+
 class Consensus:
     """پیاده‌سازی الگوریتم اجماع Proof of Stake"""
     
@@ -20,6 +125,11 @@ class Consensus:
                 return address
         return list(validators.keys())[0]
 
+    @staticmethod
+    def cumulative_difficulty(chain: Iterable['Block']) -> int:
+        """مجموع difficulty بلاک‌های زنجیره در یک پیمایش"""
+        return sum(block.difficulty for block in chain)
+
     @staticmethod
     def validate_block(block: 'Block', previous_block: 'Block') -> bool:
         """اعتبارسنجی کامل یک بلاک در PoS (با استفاده از متد is_valid خود بلاک)"""
@@ -38,11 +148,96 @@ class Consensus:
             return False
             
         # بررسی تک تک بلاک‌ها
-        for i in range(1, len(chain)):
-            current = chain[i]
-            previous = chain[i-1]
-            
+        return Consensus.is_chain_valid_range(chain, 1, genesis.hash)
+
+    @staticmethod
+    def is_chain_valid_range(chain: List['Block'], start_index: int, prev_hash: str) -> bool:
+        """اعتبارسنجی زنجیره از start_index به بعد، با فرض معتبر بودن بلاک‌های قبلی
+
+        prev_hash هش بلاکی است که قبلاً تا آن اعتبارسنجی شده؛ اگر بلاک
+        start_index - 1 با آن یکی نباشد، زنجیره عوض شده و نتیجه نامعتبر است.
+        """
+        if start_index <= 0:
+            return Consensus.is_chain_valid(chain)
+
+        if start_index > len(chain) or chain[start_index - 1].hash != prev_hash:
+            logger.error(f"Chain diverged from validated block at index {start_index - 1}")
+            return False
+
+        previous = chain[start_index - 1]
+        for current in chain[start_index:]:
             if not current.is_valid(previous):
                 return False
-                
-        return True
\ No newline at end of file
+            previous = current
+
+        return True
+
+    @staticmethod
+    def verify_blocks_parallel(chain: Iterable['Block']) -> bool:
+        """اعتبارسنجی کامل زنجیره با بررسی موازی بلاک‌ها در چند پروسه
+
+        پیوند بلاک‌ها (index و previous_hash) به صورت سریال بررسی می‌شود و
+        هش و امضای بلاک‌ها که مستقل از هم هستند، در بخش‌های VERIFY_SEGMENT_SIZE
+        تایی بین پروسه‌ها تقسیم می‌شوند. chain می‌تواند یک iterator جریانی باشد.
+        """
+        blocks = iter(chain)
+        genesis = next(blocks, None)
+        if genesis is None:
+            return False
+
+        if genesis.index != 0 or genesis.previous_hash != "0":
+            logger.error("Invalid genesis block")
+            return False
+
+        links_valid = True
+
+        def segments():
+            nonlocal links_valid
+            previous = genesis
+            segment = []
+            for current in blocks:
+                if current.index != previous.index + 1:
+                    logger.error(f"Block index mismatch: {current.index} vs {previous.index + 1}")
+                    links_valid = False
+                    return
+
+                if current.previous_hash != previous.hash:
+                    logger.error(f"Previous hash mismatch: {current.previous_hash} vs {previous.hash}")
+                    links_valid = False
+                    return
+
+                segment.append(current)
+                previous = current
+                if len(segment) == VERIFY_SEGMENT_SIZE:
+                    yield segment
+                    segment = []
+            if segment:
+                yield segment
+
+        pending_segments = segments()
+        first = next(pending_segments, None)
+        second = next(pending_segments, None)
+        if second is None:
+            # زنجیره کوتاه: راه‌اندازی پروسه‌ها ارزشش را ندارد
+            contents_valid = first is None or _verify_block_segment(first)
+        else:
+            contents_valid = _all_in_processes(
+                _verify_block_segment, iter_chain((first, second), pending_segments)
+            )
+
+        return links_valid and contents_valid
+
+    @staticmethod
+    def find_invalid_transactions(transactions: List['Transaction']) -> List[str]:
+        """هش تراکنش‌های نامعتبر؛ برای دسته‌های بزرگ امضاها به صورت موازی در چند پروسه بررسی می‌شوند"""
+        if len(transactions) < VERIFY_TX_PARALLEL_MIN:
+            return _invalid_transaction_hashes(transactions)
+
+        chunks = (
+            transactions[i:i + VERIFY_TX_CHUNK_SIZE]
+            for i in range(0, len(transactions), VERIFY_TX_CHUNK_SIZE)
+        )
+        invalid = []
+        for chunk_invalid in _map_in_processes(_invalid_transaction_hashes, chunks):
+            invalid.extend(chunk_invalid)
+        return invalid
@@ -1,6 +1,6 @@
 import sqlite3
 import json
-from typing import List, Optional
+from typing import Iterator, List, Optional
 from src.utils.database import db_connection
 from src.blockchain.block import Block
 from src.blockchain.transaction import Transaction
@@ -8,33 +8,42 @@ from src.utils.logger import logger
 
 class BlockRepository:
     @staticmethod
-    def save_block(block: Block) -> int:
+    def save_block(block: Block, conn: Optional[sqlite3.Connection] = None) -> int:
+        """ذخیره بلاک؛ با conn داده شده، درون تراکنش فراخوان و بدون commit اجرا می‌شود"""
+        if conn is not None:
+            return BlockRepository._insert_block(conn.cursor(), block)
+
         with db_connection() as conn:
             cursor = conn.cursor()
             try:
-                cursor.execute('''
-                INSERT INTO blocks (
-                    "index", timestamp, previous_hash, 
-                    hash, nonce, difficulty, 
-                    validator, stake_amount, signature
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    block.index,
-                    block.timestamp,
-                    block.previous_hash,
-                    block.hash,
-                    block.nonce,
-                    block.difficulty,
-                    block.validator,
-                    block.stake_amount,
-                    block.signature
-                ))
+                block_id = BlockRepository._insert_block(cursor, block)
                 conn.commit()
-                return cursor.lastrowid
+                return block_id
             except sqlite3.IntegrityError as e:
                 # ... error handling ...
                 print(f"Error while saving block: {e}")
 
+    @staticmethod
+    def _insert_block(cursor: sqlite3.Cursor, block: Block) -> int:
+        cursor.execute('''
+        INSERT INTO blocks (
+            "index", timestamp, previous_hash, 
+            hash, nonce, difficulty, 
+            validator, stake_amount, signature
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            block.index,
+            block.timestamp,
+            block.previous_hash,
+            block.hash,
+            block.nonce,
+            block.difficulty,
+            block.validator,
+            block.stake_amount,
+            block.signature
+        ))
+        return cursor.lastrowid
+
     @staticmethod
     def get_block_by_index(index: int) -> Optional[Block]:
         with db_connection() as conn:
@@ -67,7 +76,96 @@ class BlockRepository:
             )
             block.hash = row_dict['hash']
             return block
-            
+
+    @staticmethod
+    def iter_all_blocks() -> Iterator[Block]:
+        """پیمایش تمام بلاک‌ها به ترتیب index"""
+        return BlockRepository.iter_range(0)
+
+    @staticmethod
+    def iter_range(start: int, stop: Optional[int] = None) -> Iterator[Block]:
+        """پیمایش جریانی بلاک‌های start <= index < stop به ترتیب index
+
+        بلاک‌ها و تراکنش‌ها با دو کوئری هم‌ترتیب خوانده و در کنار هم ادغام
+        می‌شوند، بنابراین در هر لحظه فقط یک بلاک در حافظه ساخته می‌شود.
+        """
+        with db_connection() as conn:
+            tx_cursor = conn.cursor()
+            tx_cursor.execute('''
+            SELECT t.block_id, t.tx_hash, t.sender, t.recipient,
+                   t.amount, t.data, t.timestamp, t.signature
+            FROM transactions t
+            JOIN blocks b ON b.id = t.block_id
+            WHERE b."index" >= ? AND (? IS NULL OR b."index" < ?)
+            ORDER BY b."index", t.id
+            ''', (start, stop, stop))
+            tx_row = tx_cursor.fetchone()
+
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT id, "index", timestamp, previous_hash, hash, nonce,
+                   difficulty, validator, stake_amount, signature
+            FROM blocks
+            WHERE "index" >= ? AND (? IS NULL OR "index" < ?)
+            ORDER BY "index" ASC
+            ''', (start, stop, stop))
+
+            for row in cursor:
+                transactions = []
+                while tx_row is not None and tx_row[0] == row[0]:
+                    tx = Transaction(
+                        sender=tx_row[2],
+                        recipient=tx_row[3],
+                        amount=tx_row[4],
+                        data=json.loads(tx_row[5]),
+                        timestamp=tx_row[6],
+                        signature=tx_row[7]
+                    )
+                    # بررسی تطابق هش
+                    if tx.tx_hash != tx_row[1]:
+                        logger.warning(f"Transaction hash mismatch for tx {tx_row[1]}")
+                    else:
+                        transactions.append(tx)
+                    tx_row = tx_cursor.fetchone()
+
+                block = Block(
+                    index=row[1],
+                    timestamp=row[2],
+                    transactions=transactions,
+                    previous_hash=row[3],
+                    nonce=row[5],
+                    difficulty=row[6],
+                    validator=row[7],
+                    stake_amount=row[8],
+                    signature=row[9]
+                )
+                block.hash = row[4]
+                yield block
+
+    @staticmethod
+    def get_hashes(start: int, stop: int) -> List[str]:
+        """هش بلاک‌های start <= index < stop به ترتیب index"""
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT hash FROM blocks WHERE "index" >= ? AND "index" < ? ORDER BY "index"',
+                (start, stop)
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def get_difficulty_sum(start: int, conn: sqlite3.Connection) -> int:
+        """مجموع difficulty بلاک‌های index >= start"""
+        row = conn.execute(
+            'SELECT COALESCE(SUM(difficulty), 0) FROM blocks WHERE "index" >= ?', (start,)
+        ).fetchone()
+        return row[0]
+
+    @staticmethod
+    def delete_from_index(start: int, conn: sqlite3.Connection) -> None:
+        """حذف بلاک‌های index >= start (تراکنش‌ها با ON DELETE CASCADE حذف می‌شوند)"""
+        conn.execute('DELETE FROM blocks WHERE "index" >= ?', (start,))
+
     @staticmethod
     def get_blocks_paginated(page: int = 1, per_page: int = 10) -> List[Block]:
         """بازیابی بلاک‌ها به صورت صفحه‌بندی شده"""
@@ -122,7 +220,7 @@ class TransactionRepository:
                     transaction.sender,
                     transaction.recipient,
                     transaction.amount,
-                    json.dumps(transaction.data),
+                    transaction.data_json,
                     transaction.timestamp,
                     transaction.signature
                 ))
@@ -134,33 +232,43 @@ class TransactionRepository:
                 raise
 
     @staticmethod
-    def save_transactions_bulk(transactions: List[Transaction], block_id: int) -> None:
-        """ذخیره دسته‌ای تراکنش‌ها"""
+    def save_transactions_bulk(transactions: List[Transaction], block_id: int,
+                               conn: Optional[sqlite3.Connection] = None) -> None:
+        """ذخیره دسته‌ای تراکنش‌ها؛ با conn داده شده، بدون commit اجرا می‌شود"""
+        if conn is not None:
+            TransactionRepository._insert_transactions(conn.cursor(), transactions, block_id)
+            return
+
         with db_connection() as conn:
             cursor = conn.cursor()
             try:
-                cursor.executemany('''
-                INSERT OR IGNORE INTO transactions (
-                    block_id, tx_hash, sender, recipient, 
-                    amount, data, timestamp, signature
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', [
-                    (
-                        block_id,
-                        tx.tx_hash,
-                        tx.sender,
-                        tx.recipient,
-                        tx.amount,
-                        json.dumps(tx.data),
-                        tx.timestamp,
-                        tx.signature
-                    ) for tx in transactions
-                ])
+                cursor.execute('BEGIN')
+                TransactionRepository._insert_transactions(cursor, transactions, block_id)
                 conn.commit()
             except Exception as e:
                 conn.rollback()
                 raise
 
+    @staticmethod
+    def _insert_transactions(cursor: sqlite3.Cursor, transactions: List[Transaction], block_id: int) -> None:
+        cursor.executemany('''
+        INSERT OR IGNORE INTO transactions (
+            block_id, tx_hash, sender, recipient, 
+            amount, data, timestamp, signature
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (
+                block_id,
+                tx.tx_hash,
+                tx.sender,
+                tx.recipient,
+                tx.amount,
+                tx.data_json,
+                tx.timestamp,
+                tx.signature
+            ) for tx in transactions
+        ])
+
     @staticmethod
     def get_transactions_by_block_id(block_id: int) -> List[Transaction]:
         """بازیابی تمام تراکنش‌های یک بلاک"""
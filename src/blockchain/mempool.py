@@ -1,3 +1,5 @@
+import array
+import atexit
 import heapq
 from typing import List, Dict
 from src.blockchain.contracts.contract_repository import ContractRepository
@@ -5,20 +7,61 @@ from src.blockchain.db.state_db import StateDB
 from src.blockchain.transaction import Transaction
 from src.utils.logger import logger
 from src.utils.database import db_connection
-from src.p2p.network import P2PNetwork
-import json
+import queue
+import threading
 import time
 import sqlite3
+import weakref
+
+try:
+    import numpy as np
+except ImportError:  # numpy اختیاری است؛ در نبود آن اسکن انقضا با پایتون خالص انجام می‌شود
+    np = None
 
 EXPIRY_SECONDS = 3600  # 1 hour
 
+# نوشتن دسته‌ای: حداکثر تعداد درج در هر دسته و حداکثر زمان انتظار برای پر شدن دسته
+WRITE_BATCH_SIZE = 64
+WRITE_BATCH_INTERVAL = 0.01  # 10ms
+
+# علامت توقف writer پس‌زمینه
+_STOP = object()
+
+# mempoolهایی که writer فعال دارند؛ هنگام خروج پروسه صف آن‌ها تخلیه می‌شود
+_active_mempools = weakref.WeakSet()
+
+def _close_active_mempools():
+    """تخلیه صف تمام mempoolها پیش از بسته شدن اتصال‌های دیتابیس در atexit"""
+    for mempool in list(_active_mempools):
+        mempool.close()
+
+# پس از atexit ماژول database ثبت می‌شود و بنابراین زودتر از close_connections اجرا می‌شود
+atexit.register(_close_active_mempools)
+
+# متن ثابت کوئری‌ها؛ کش statement اتصال ماندگار هر thread نسخه کامپایل شده را نگه می‌دارد
+INSERT_SQL = (
+    'INSERT OR IGNORE INTO mempool '
+    '(tx_hash, sender, recipient, amount, data, timestamp, signature, contract_type) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+)
+DELETE_SQL = 'DELETE FROM mempool WHERE tx_hash = ?'
+
 class Mempool:
     def __init__(self):
         self.transactions = {}
+        # heap از (timestamp, tx_hash)؛ ورودی‌های حذف شده به صورت تنبل کنار گذاشته می‌شوند
         self.priority_queue = []
-        self.expiration_queue = []
+        # ستون‌های موازی timestamp/hash برای اسکن پیوسته انقضا؛ ورودی‌های حذف شده به صورت تنبل کنار گذاشته می‌شوند
+        self._timestamps = array.array('d')
+        self._hashes = []
         self.max_size = 1000
-        self.p2p_network = P2PNetwork
+        self.p2p_network = None
+
+        # صف درج‌های دیتابیس که توسط یک thread پس‌زمینه به صورت دسته‌ای نوشته می‌شود؛
+        # writer در اولین درج راه‌اندازی می‌شود
+        self._write_queue = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
 
         # بارگذاری فقط در صورتی که جدول mempool وجود دارد
         try:
@@ -34,15 +77,35 @@ class Mempool:
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='mempool'")
             if not cursor.fetchone():
                 return
-                
-            cursor.execute('SELECT * FROM mempool')
 
-    def add_transaction(self, tx: Transaction) -> bool:
-        """اضافه کردن تراکنش جدید به mempool"""
+            cursor.execute(
+                'SELECT tx_hash, sender, recipient, amount, data, timestamp, signature, contract_type '
+                'FROM mempool'
+            )
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                for row in rows:
+                    tx = Transaction.from_row(row)
+                    # ردیفی که با هش خودش نمی‌خواند در زمان ساخت بلاک رد می‌شد؛ همین‌جا کنار گذاشته می‌شود
+                    if tx.calculate_hash() != tx.tx_hash:
+                        logger.warning(f"Dropping mempool row with mismatched hash: {tx.tx_hash[:8]}")
+                        continue
+                    self._track_transaction(tx)
+
+        if self.transactions:
+            logger.info(f"Loaded {len(self.transactions)} transactions from mempool database")
 
-        heapq.heappush(self.priority_queue, (-tx.fee, tx.timestamp, tx))
-        heapq.heappush(self.expiration_queue, (tx.timestamp + EXPIRY_SECONDS, tx.tx_hash))
+    def _track_transaction(self, tx: Transaction):
+        """ثبت تراکنش در حافظه و صف‌های اولویت"""
+        self.transactions[tx.tx_hash] = tx
+        heapq.heappush(self.priority_queue, (tx.timestamp, tx.tx_hash))
+        self._timestamps.append(tx.timestamp)
+        self._hashes.append(tx.tx_hash)
 
+    def add_transaction(self, tx: Transaction) -> bool:
+        """اضافه کردن تراکنش جدید به mempool"""
         try:
             # اعتبارسنجی اولیه تراکنش
             if not tx.tx_hash or tx.tx_hash != tx.calculate_hash():
@@ -56,29 +119,22 @@ class Mempool:
             if len(self.transactions) >= self.max_size:
                 logger.warning("Mempool is full, transaction rejected")
                 return False
-            
-            if tx.tx_hash not in self.transactions:
-                if hasattr(self, 'p2p_network'):
-                    self.p2p_network.broadcast_transaction(tx)
 
             if not self._validate_transaction(tx):
                 return False
             
             # ذخیره در حافظه
-            self.transactions[tx.tx_hash] = tx
+            self._track_transaction(tx)
             
-            # ذخیره در دیتابیس
-            with db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR IGNORE INTO mempool (
-                        tx_hash, sender, recipient, amount, data, timestamp, signature
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    tx.tx_hash, tx.sender, tx.recipient, tx.amount, json.dumps(tx.data), tx.timestamp, tx.signature
-                ))
-                conn.commit()
-                logger.info(f"Transaction {tx.tx_hash[:8]} added to mempool database")
+            # ذخیره در دیتابیس توسط writer پس‌زمینه
+            self._enqueue_insert((
+                tx.tx_hash, tx.sender, tx.recipient, tx.amount, tx.data_json, tx.timestamp, tx.signature,
+                tx.contract_type
+            ))
+
+            # انتشار فقط یک بار و فقط برای تراکنش پذیرفته شده
+            if self.p2p_network is not None:
+                self.p2p_network.broadcast_transaction(tx)
                 
             return True
         except Exception as e:
@@ -87,49 +143,175 @@ class Mempool:
 
     def get_transactions(self, max_count: int = 10) -> List[Transaction]:
         """دریافت تراکنش‌ها برای ساخت بلاک جدید"""
-        # اولویت‌بندی بر اساس کارمزد یا timestamp
-        sorted_txs = sorted(
-            self.transactions.values(),
-            key=lambda tx: tx.timestamp
-        )
-        return sorted_txs[:max_count]
+        # اولویت‌بندی بر اساس timestamp (با اضافه شدن کارمزد، کلید به (-fee, timestamp) تغییر می‌کند)
+        selected = []
+        popped = []
+        seen = set()
+        while self.priority_queue and len(selected) < max_count:
+            entry = heapq.heappop(self.priority_queue)
+            tx = self.transactions.get(entry[1])
+            if tx is None or entry[1] in seen:
+                # ورودی کهنه یا تکراری برای همیشه کنار گذاشته می‌شود
+                continue
+            seen.add(entry[1])
+            popped.append(entry)
+            selected.append(tx)
+
+        for entry in popped:
+            heapq.heappush(self.priority_queue, entry)
+        return selected
+
+    def _compact_priority_queue(self):
+        """بازسازی heap وقتی ورودی‌های کهنه بیش از ورودی‌های زنده شوند"""
+        if len(self.priority_queue) > 2 * len(self.transactions) + 64:
+            self.priority_queue = [
+                entry for entry in self.priority_queue if entry[1] in self.transactions
+            ]
+            heapq.heapify(self.priority_queue)
+
+    def _compact_columns(self):
+        """بازسازی ستون‌های timestamp/hash وقتی ورودی‌های کهنه بیش از ورودی‌های زنده شوند"""
+        if len(self._hashes) > 2 * len(self.transactions) + 64:
+            live = [
+                (ts, tx_hash) for ts, tx_hash in zip(self._timestamps, self._hashes)
+                if tx_hash in self.transactions
+            ]
+            self._timestamps = array.array('d', [ts for ts, _ in live])
+            self._hashes = [tx_hash for _, tx_hash in live]
+
+    def _hashes_older_than(self, cutoff: float) -> List[str]:
+        """هش ورودی‌هایی از ستون‌ها که timestamp آن‌ها قبل از cutoff است"""
+        if not self._hashes:
+            return []
+        if np is not None:
+            timestamps = np.frombuffer(self._timestamps, dtype=np.float64)
+            return [self._hashes[i] for i in np.flatnonzero(timestamps < cutoff)]
+        return [
+            tx_hash for ts, tx_hash in zip(self._timestamps, self._hashes)
+            if ts < cutoff
+        ]
 
     def remove_transactions(self, tx_hashes: List[str]):
         """حذف تراکنش‌های تایید شده از mempool"""
-        with db_connection() as conn:
-            cursor = conn.cursor()
-            for tx_hash in tx_hashes:
-                # حذف از حافظه
-                if tx_hash in self.transactions:
-                    del self.transactions[tx_hash]
-                
-                # حذف از دیتابیس
-                cursor.execute('DELETE FROM mempool WHERE tx_hash = ?', (tx_hash,))
-            conn.commit()
+        # حذف از حافظه
+        for tx_hash in tx_hashes:
+            self.transactions.pop(tx_hash, None)
+        self._compact_priority_queue()
+        self._compact_columns()
+
+        # حذف از دیتابیس در یک تراکنش
+        self._delete_from_db(tx_hashes)
         
         logger.info(f"Removed {len(tx_hashes)} transactions from mempool")
 
     def clear_expired(self, expiry_seconds: int = 3600):
         """پاک‌سازی تراکنش‌های منقضی شده"""
-        now = time.time()
+        cutoff = time.time() - expiry_seconds
         expired = [
-            tx_hash for tx_hash, tx in self.transactions.items()
-            if now - tx.timestamp > expiry_seconds
+            tx_hash for tx_hash in dict.fromkeys(self._hashes_older_than(cutoff))
+            if tx_hash in self.transactions
         ]
         
-        with db_connection() as conn:
-            cursor = conn.cursor()
-            for tx_hash in expired:
-                # حذف از حافظه
-                del self.transactions[tx_hash]
-                
-                # حذف از دیتابیس
-                cursor.execute('DELETE FROM mempool WHERE tx_hash = ?', (tx_hash,))
-            conn.commit()
+        # حذف از حافظه
+        for tx_hash in expired:
+            del self.transactions[tx_hash]
+        self._compact_priority_queue()
+        self._compact_columns()
+
+        # حذف از دیتابیس در یک تراکنش
+        self._delete_from_db(expired)
         
         logger.info(f"Cleared {len(expired)} expired transactions")
 
 
+    def _delete_from_db(self, tx_hashes: List[str]):
+        """حذف دسته‌ای تراکنش‌ها از جدول mempool در یک تراکنش دیتابیس"""
+        if not tx_hashes:
+            return
+
+        # درج‌های در صف باید قبل از حذف نوشته شوند تا ردیف حذف شده دوباره برنگردد
+        self.flush()
+
+        with db_connection() as conn:
+            conn.execute('BEGIN')
+            conn.executemany(DELETE_SQL, [(tx_hash,) for tx_hash in tx_hashes])
+            conn.commit()
+
+    def _enqueue_insert(self, row: tuple):
+        """افزودن درج به صف و راه‌اندازی writer پس‌زمینه در صورت نیاز"""
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._run_writer, name="mempool-writer", daemon=True
+                )
+                self._writer.start()
+                _active_mempools.add(self)
+            self._write_queue.put(row)
+
+    def _run_writer(self):
+        """حلقه writer پس‌زمینه: درج‌ها را تا WRITE_BATCH_SIZE یا WRITE_BATCH_INTERVAL جمع و یکجا می‌نویسد"""
+        while True:
+            batch = []
+            marker = None
+            stop = False
+            item = self._write_queue.get()
+            deadline = time.monotonic() + WRITE_BATCH_INTERVAL
+            while True:
+                if item is _STOP:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    # نشانگر flush: دسته فعلی همین حالا نوشته می‌شود
+                    marker = item
+                    break
+                batch.append(item)
+                timeout = deadline - time.monotonic()
+                if len(batch) >= WRITE_BATCH_SIZE or timeout <= 0:
+                    break
+                try:
+                    item = self._write_queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write_batch(batch)
+            if marker is not None:
+                marker.set()
+            if stop:
+                return
+
+    def _write_batch(self, batch: List[tuple]):
+        """نوشتن یک دسته درج با یک executemany در یک تراکنش دیتابیس"""
+        try:
+            with db_connection() as conn:
+                conn.execute('BEGIN')
+                conn.executemany(INSERT_SQL, batch)
+                conn.commit()
+            logger.info(f"{len(batch)} transactions written to mempool database")
+        except Exception as e:
+            logger.error(f"Failed to write mempool batch: {e}")
+
+    def flush(self):
+        """انتظار تا نوشته شدن درج‌هایی که تا این لحظه در صف قرار گرفته‌اند
+
+        به جای Queue.join که منتظر درج‌های بعدی تولیدکننده‌های دیگر هم می‌ماند،
+        یک نشانگر در صف گذاشته و فقط تا رسیدن writer به آن صبر می‌شود.
+        """
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                return
+            done = threading.Event()
+            self._write_queue.put(done)
+        done.wait()
+
+    def close(self):
+        """تخلیه صف و توقف writer پس‌زمینه"""
+        with self._writer_lock:
+            if self._writer is not None and self._writer.is_alive():
+                self._write_queue.put(_STOP)
+                self._writer.join()
+            self._writer = None
+
     def _validate_transaction(self, tx):
         # 1. بررسی امضا
         if not tx.is_valid():
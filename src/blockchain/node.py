@@ -187,5 +187,9 @@ class BlockchainNode:
         if self.p2p_network is not None:
             self.p2p_network.socket.close()
             logger.info("P2P network stopped")
+
+        if self.mempool is not None:
+            self.mempool.close()
+            logger.info("Mempool writer stopped")
         
         logger.info("Node shutdown complete")
\ No newline at end of file
@@ -1,5 +1,7 @@
 # src/blockchain/transaction.py
+import hashlib
 import json
+import operator
 import time
 from dataclasses import dataclass, field
 from typing import Dict, Any, Optional
@@ -25,10 +27,28 @@ class Transaction:
     gas_limit: int = 1000000
     gas_price: float = 0.0001
 
+    # کش هش و JSON به همراه اشیای ورودی آن‌ها؛ بدون annotation تعریف شده‌اند تا فیلد
+    # dataclass نباشند و هزینه‌ای به __init__ اضافه نکنند. کش فقط وقتی معتبر است که
+    # همان اشیا (is) هنوز در فیلدها باشند، پس هر مقداردهی دوباره آن را باطل می‌کند.
+    _hash_cached = None
+    _hash_inputs = None
+    _data_json = None
+    _data_json_source = None
+
     def __post_init__(self):
         if self.tx_hash is None:
             self.tx_hash = self.calculate_hash()
 
+    @property
+    def data_json(self) -> str:
+        """Compact, key-sorted JSON of data for storage (memoized until data is reassigned)"""
+        if self._data_json is None or self._data_json_source is not self.data:
+            self._data_json = json.dumps(
+                self.data, sort_keys=True, separators=(',', ':'), ensure_ascii=False
+            )
+            self._data_json_source = self.data
+        return self._data_json
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert transaction to dictionary"""
         return {
@@ -56,23 +76,40 @@ class Transaction:
             contract_type=data.get('contract_type', 'NORMAL')
         )
 
+    @classmethod
+    def from_row(cls, row) -> 'Transaction':
+        """Create transaction from a (tx_hash, sender, recipient, amount, data, timestamp, signature, contract_type) row"""
+        return cls(
+            sender=row[1],
+            recipient=row[2],
+            amount=row[3],
+            data=json.loads(row[4]),
+            timestamp=row[5],
+            signature=row[6],
+            tx_hash=row[0],
+            contract_type=row[7]
+        )
+
     def _calculate_hash(self, hash_data: Dict[str, Any]) -> str:
         """Internal method for hash calculation"""
-        import hashlib
         return hashlib.sha256(
             json.dumps(hash_data, sort_keys=True).encode()
         ).hexdigest()
 
     def calculate_hash(self) -> str:
-        """Calculate transaction hash"""
-        return self._calculate_hash({
-            "sender": self.sender,
-            "recipient": self.recipient,
-            "amount": self.amount,
-            "data": self.data,
-            "timestamp": self.timestamp,
-            "contract_type": self.contract_type
-        })
+        """Calculate transaction hash (memoized until a hashed field is reassigned)"""
+        inputs = (self.sender, self.recipient, self.amount, self.data, self.timestamp, self.contract_type)
+        if self._hash_inputs is None or not all(map(operator.is_, inputs, self._hash_inputs)):
+            self._hash_cached = self._calculate_hash({
+                "sender": self.sender,
+                "recipient": self.recipient,
+                "amount": self.amount,
+                "data": self.data,
+                "timestamp": self.timestamp,
+                "contract_type": self.contract_type
+            })
+            self._hash_inputs = inputs
+        return self._hash_cached
 
     def sign(self, private_key) -> None:
         """Improved signing method"""
@@ -111,7 +111,9 @@ class CommandExecutor:
             # In production, use actual validator key
             validator_key = ec.generate_private_key(ec.SECP256K1())
             
-            new_block = self.node.blockchain.add_block(transactions, validator_key)
+            # Evict transactions dropped for invalid signatures so they are not mined again
+            new_block = self.node.blockchain.add_block(transactions, validator_key,
+                                                       on_rejected=self.node.mempool.remove_transactions)
             if new_block:
                 print_success(f"Block #{new_block.index} mined successfully!")
                 self.node.mempool.remove_transactions([tx.tx_hash for tx in transactions])
@@ -61,9 +61,8 @@ class MessageHandler:
         try:
             received_chain = [Block.from_dict(block) for block in chain_data]
             
-            if (self.blockchain.is_chain_valid(received_chain) and 
-                len(received_chain) > len(self.blockchain.chain)):
-                self.blockchain.chain = received_chain
+            # Validation and the cumulative-difficulty check happen in replace_chain
+            if self.blockchain.replace_chain(received_chain):
                 logger.info("Blockchain replaced with longer valid chain")
         except Exception as e:
             logger.error(f"Error processing blockchain: {e}")
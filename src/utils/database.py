@@ -1,25 +1,125 @@
 import sqlite3
 import os
+import atexit
 import contextlib
+import threading
+import weakref
 from src.utils.logger import logger
 
 DB_FILE = "data/blockchain.db"
 MIGRATION_DIR = "data/migrations"
 
+# WAL به همراه synchronous=NORMAL از fsync دوباره در هر commit جلوگیری می‌کند
+CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -65536",
+)
+
+class _ConnectionHolder:
+    """نگه‌دارنده اتصال یک thread؛ با پایان thread و آزاد شدن آن، اتصال بسته می‌شود"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.pid = os.getpid()
+
+    def close(self):
+        # اتصال به ارث رسیده از پروسه والد در پروسه فرزند بسته نمی‌شود
+        if self.conn is not None and self.pid == os.getpid():
+            try:
+                self.conn.close()
+            except sqlite3.Error:
+                pass
+        self.conn = None
+
+    def __del__(self):
+        self.close()
+
+# هر thread یک اتصال ماندگار دارد که تنها مرجع قوی آن در threading.local است؛
+# با پایان thread اتصال بسته می‌شود و _holders فقط ارجاع ضعیف نگه می‌دارد
+_local = threading.local()
+_holders = weakref.WeakSet()
+_holders_lock = threading.Lock()
+_generation = 0
+# توابعی که باید پیش از بستن اتصال‌ها اجرا شوند (مثل توقف پروسه‌هایی که فایل دیتابیس را باز نگه می‌دارند)
+_close_callbacks = []
+
+def register_close_callback(callback):
+    """ثبت تابعی که close_connections پیش از بستن اتصال‌ها فراخوانی می‌کند"""
+    _close_callbacks.append(callback)
+
+def _get_connection() -> sqlite3.Connection:
+    """دریافت اتصال کش شده thread جاری یا ایجاد آن"""
+    holder = getattr(_local, 'holder', None)
+    if (holder is None or holder.conn is None or holder.pid != os.getpid() or
+            _local.path != DB_FILE or _local.generation != _generation):
+        # تراکنش‌ها به صورت صریح با BEGIN/COMMIT مدیریت می‌شوند
+        conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+
+        holder = _ConnectionHolder(conn)
+        with _holders_lock:
+            _holders.add(holder)
+        _local.holder = holder
+        _local.path = DB_FILE
+        _local.generation = _generation
+        _local.depth = 0
+    return holder.conn
+
+def close_connections():
+    """بستن تمام اتصال‌های کش شده (هنگام خروج یا پیش از حذف فایل دیتابیس)"""
+    global _generation
+    for callback in list(_close_callbacks):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Close callback failed: {e}")
+    with _holders_lock:
+        _generation += 1
+        for holder in list(_holders):
+            holder.close()
+
+atexit.register(close_connections)
+
+def remove_database() -> bool:
+    """بستن اتصال‌ها و حذف فایل دیتابیس همراه با فایل‌های -wal و -shm آن
+
+    فایل‌های WAL باقی‌مانده از دیتابیس قبلی روی فایل جدید اعمال می‌شوند و
+    init_db را با خطای disk I/O متوقف می‌کنند، پس همه با هم حذف می‌شوند.
+    """
+    close_connections()
+    removed = False
+    for path in (DB_FILE, DB_FILE + "-wal", DB_FILE + "-shm"):
+        try:
+            os.remove(path)
+            removed = removed or path == DB_FILE
+        except FileNotFoundError:
+            pass
+    return removed
+
 @contextlib.contextmanager
 def db_connection():
     """مدیریت اتصال به دیتابیس با context manager"""
-    conn = sqlite3.connect(DB_FILE)
-    conn.execute("PRAGMA foreign_keys = ON")
+    conn = _get_connection()
+    _local.depth += 1
     try:
         yield conn
     except Exception as e:
         logger.error(f"Database error: {e}")
-        conn.rollback()
+        if conn.in_transaction:
+            conn.rollback()
         raise
     finally:
-        conn.close()
-        
+        _local.depth -= 1
+        # تراکنش رها شده مانند بستن اتصال در نسخه قبلی برگشت داده می‌شود
+        if _local.depth == 0 and conn.in_transaction:
+            conn.rollback()
+
 def init_db():
     """مقداردهی اولیه دیتابیس و ایجاد جداول"""
     os.makedirs("data", exist_ok=True)
@@ -125,10 +225,13 @@ def init_db():
             tx_hash TEXT NOT NULL UNIQUE,
             sender TEXT NOT NULL,
             recipient TEXT NOT NULL,
-            amount REAL NOT NULL,
+            -- amount و timestamp بدون نوع (affinity BLOB) هستند تا int و float همان‌طور که
+            -- در هش تراکنش آمده‌اند برگردند؛ ستون REAL مقدار 10 را 10.0 برمی‌گرداند
+            amount NOT NULL,
             data TEXT NOT NULL,
-            timestamp REAL NOT NULL,
+            timestamp NOT NULL,
             signature TEXT,
+            contract_type TEXT NOT NULL DEFAULT 'NORMAL',
             fee REAL DEFAULT 0
         );
                              
@@ -1,13 +1,11 @@
-from src.utils.database import init_db
+from src.utils.database import init_db, remove_database
 from src.utils.logger import logger
-import os
 
 def reset_database():
     logger.warning("Resetting database...")
-    try:
-        os.remove("data/blockchain.db")
+    if remove_database():
         logger.info("Database file removed")
-    except FileNotFoundError:
+    else:
         logger.warning("Database file not found")
     
     init_db()
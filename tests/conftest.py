@@ -1,16 +1,13 @@
 import pytest
-import os
-from src.utils.database import init_db, db_connection
+from src.utils.database import init_db, db_connection, remove_database
 
 @pytest.fixture(scope="function")
 def clean_db():
     """فیکسچر برای ایجاد دیتابیس جدید قبل از هر تست"""
-    if os.path.exists("data/blockchain.db"):
-        os.remove("data/blockchain.db")
+    remove_database()
     init_db()
     yield
-    if os.path.exists("data/blockchain.db"):
-        os.remove("data/blockchain.db")
+    remove_database()
 
 @pytest.fixture
 def sample_transaction():
@@ -1,6 +1,43 @@
+import sqlite3
 import pytest
+from src.blockchain.block import Block
 from src.blockchain.chain import Blockchain
+from src.blockchain.consensus import consensus as consensus_module
+from src.blockchain.consensus.consensus import Consensus, VERIFY_TX_PARALLEL_MIN
+from src.blockchain.mempool import Mempool
 from src.blockchain.transaction import Transaction
+from src.blockchain.db.repositories import TransactionRepository
+from src.blockchain.consensus.validator_registry import ValidatorRegistry
+from src.utils.crypto import public_key_to_pem
+from src.utils.database import db_connection
+from cryptography.hazmat.primitives.asymmetric import ec
+
+@pytest.fixture
+def blockchain(clean_db):
+    return Blockchain()
+
+@pytest.fixture
+def validator_key(blockchain):
+    """کلید ولیدیتور ثبت شده؛ حساب Alice هم با همین کلید عمومی ثبت می‌شود"""
+    key = ec.generate_private_key(ec.SECP256K1())
+    pem = public_key_to_pem(key.public_key())
+    ValidatorRegistry.register_validator(ValidatorRegistry.get_validator_address(key), pem, 100)
+    with db_connection() as conn:
+        conn.execute("INSERT INTO accounts VALUES (?, ?)", ("Alice", pem))
+    return key
+
+@pytest.fixture
+def mempool(blockchain, monkeypatch):
+    """mempool روی همان دیتابیس؛ بررسی موجودی دور زده می‌شود تا امضا فقط هنگام ساخت بلاک بررسی شود"""
+    monkeypatch.setattr(Mempool, "_validate_transaction", lambda self, tx: True)
+    pool = Mempool()
+    yield pool
+    pool.close()
+
+def _signed_transaction(key, amount: float) -> Transaction:
+    tx = Transaction(sender="Alice", recipient="Bob", amount=amount)
+    tx.sign(key)
+    return tx
 
 def test_blockchain_initialization(clean_db):
     blockchain = Blockchain()
@@ -22,13 +59,125 @@ def test_block_addition(clean_db):
     assert len(blockchain.chain) == 2
     assert new_block.transactions[0].tx_hash == tx.tx_hash
 
-def test_chain_validation(clean_db):
-    blockchain = Blockchain()
-    tx = Transaction(sender="Alice", recipient="Bob", amount=10.0)
-    blockchain.add_block([tx], validator_private_key=None)
+def test_chain_validation(blockchain, validator_key):
+    tx = _signed_transaction(validator_key, 10.0)
+    assert blockchain.add_block([tx], validator_private_key=validator_key) is not None
     
     assert blockchain.is_chain_valid() is True
     
-    # دستکاری زنجیره
-    blockchain.chain[1].transactions[0].amount = 100.0
-    assert blockchain.is_chain_valid() is False
\ No newline at end of file
+    # دستکاری ردیف ذخیره شده تراکنش؛ chain[1] هر بار از دیتابیس خوانده می‌شود
+    with db_connection() as conn:
+        conn.execute("UPDATE transactions SET amount = ? WHERE tx_hash = ?", (100.0, tx.tx_hash))
+    assert blockchain.is_chain_valid(full=True) is False
+
+def test_chain_validation_across_segments(blockchain, validator_key, monkeypatch):
+    # بخش‌های دوتایی تا اعتبارسنجی زنجیره کوتاه هم بین چند پروسه تقسیم شود
+    monkeypatch.setattr(consensus_module, "VERIFY_SEGMENT_SIZE", 2)
+    segment_sizes = []
+    map_in_processes = consensus_module._map_in_processes
+
+    def recording_map(func, items):
+        items = list(items)
+        segment_sizes.append([len(item) for item in items])
+        return map_in_processes(func, items)
+    monkeypatch.setattr(consensus_module, "_map_in_processes", recording_map)
+
+    transactions = [_signed_transaction(validator_key, float(i + 1)) for i in range(6)]
+    for tx in transactions:
+        assert blockchain.add_block([tx], validator_key) is not None
+
+    assert blockchain.is_chain_valid(full=True) is True
+    assert segment_sizes == [[2, 2, 2]]
+
+    # دستکاری تراکنش بلاک 5 که در بخش آخر قرار دارد
+    with db_connection() as conn:
+        conn.execute("UPDATE transactions SET amount = ? WHERE tx_hash = ?", (100.0, transactions[4].tx_hash))
+    assert blockchain.is_chain_valid(full=True) is False
+    assert len(segment_sizes) == 2
+
+def test_failed_block_save_leaves_no_orphan_block(blockchain, validator_key, monkeypatch):
+    def fail(*args, **kwargs):
+        raise sqlite3.OperationalError("simulated failure")
+    monkeypatch.setattr(TransactionRepository, "save_transactions_bulk", fail)
+
+    assert blockchain.add_block([_signed_transaction(validator_key, 10.0)], validator_key) is None
+
+    # بلاک و تراکنش‌هایش در یک تراکنش دیتابیس ذخیره می‌شوند؛ شکست باید کل آن را برگرداند
+    with db_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM blocks").fetchone()[0] == 1
+    assert len(blockchain.chain) == 1
+    assert blockchain.get_last_block().index == 0
+
+def test_replace_chain_updates_tip_and_height(blockchain, validator_key):
+    for i in range(3):
+        assert blockchain.add_block([_signed_transaction(validator_key, float(i))], validator_key)
+    full = list(blockchain.chain)
+
+    blockchain._replace_chain([], 2)
+    assert len(blockchain.chain) == 2
+    assert blockchain.get_last_block().hash == full[1].hash
+    assert [b.hash for b in blockchain.chain[::-1]] == [full[1].hash, full[0].hash]
+
+    # زنجیره معتبر با سختی تجمعی بیشتر دوباره پذیرفته می‌شود
+    assert blockchain.replace_chain(full) is True
+    assert len(blockchain.chain) == 4
+    assert blockchain.get_last_block().hash == full[-1].hash
+    assert blockchain.is_chain_valid(full=True) is True
+
+def test_replace_chain_rejects_forged_chain(blockchain, validator_key, caplog):
+    assert blockchain.add_block([_signed_transaction(validator_key, 1.0)], validator_key)
+    before = [b.hash for b in blockchain.chain]
+
+    # بلاک‌های جعلی از روی بلاک واقعی کپی و به هم زنجیر می‌شوند اما دوباره امضا نمی‌شوند؛
+    # زنجیره بلندتر است تا از بررسی سختی تجمعی عبور کند و با اعتبارسنجی رد شود
+    forged = list(blockchain.chain)
+    for index in range(2, 6):
+        forged.append(Block.from_dict({**forged[1].to_dict(), "index": index,
+                                       "previous_hash": forged[-1].hash}))
+    assert Consensus.cumulative_difficulty(forged) > blockchain._cum_difficulty
+
+    assert blockchain.replace_chain(forged) is False
+    assert "Received chain is invalid" in caplog.text
+    assert [b.hash for b in blockchain.chain] == before
+
+def test_cumulative_difficulty_follows_chain_changes(blockchain, validator_key):
+    def stored_total():
+        return Consensus.cumulative_difficulty(blockchain.chain)
+
+    for i in range(3):
+        assert blockchain.add_block([_signed_transaction(validator_key, float(i))], validator_key)
+    assert blockchain._cum_difficulty == stored_total()
+    full = list(blockchain.chain)
+
+    blockchain._replace_chain([], 1)
+    assert blockchain._cum_difficulty == stored_total() == full[0].difficulty
+
+    assert blockchain.replace_chain(full) is True
+    assert blockchain._cum_difficulty == stored_total()
+
+    # بارگذاری دوباره از دیتابیس همان مجموع را می‌سازد
+    assert blockchain.load_chain() is True
+    assert blockchain._cum_difficulty == stored_total()
+
+@pytest.mark.parametrize("count", [4, VERIFY_TX_PARALLEL_MIN + 4])
+def test_add_block_drops_and_evicts_invalid_transactions(blockchain, validator_key, mempool, count):
+    # هر چهارمین تراکنش با کلیدی غیر از کلید ثبت شده Alice امضا می‌شود
+    other_key = ec.generate_private_key(ec.SECP256K1())
+    transactions = [
+        _signed_transaction(other_key if i % 4 == 0 else validator_key, float(i + 1))
+        for i in range(count)
+    ]
+    for tx in transactions:
+        assert mempool.add_transaction(tx)
+    invalid = [tx.tx_hash for i, tx in enumerate(transactions) if i % 4 == 0]
+    valid = [tx.tx_hash for i, tx in enumerate(transactions) if i % 4 != 0]
+
+    assert Consensus.find_invalid_transactions(transactions) == invalid
+
+    new_block = blockchain.add_block(transactions, validator_private_key=validator_key,
+                                     on_rejected=mempool.remove_transactions)
+
+    assert new_block is not None
+    assert [tx.tx_hash for tx in new_block.transactions] == valid
+    # فقط تراکنش‌های نامعتبر حذف می‌شوند؛ حذف تراکنش‌های استخراج شده با فراخواننده است
+    assert set(mempool.transactions) == set(valid)
@@ -0,0 +1,32 @@
+import pytest
+from types import SimpleNamespace
+from src.api.api_server import app
+from src.blockchain.mempool import Mempool
+
+@pytest.fixture
+def node(clean_db, monkeypatch):
+    """نود ساختگی با mempool واقعی؛ اعتبارسنجی امضا و موجودی دور زده می‌شود"""
+    monkeypatch.setattr(Mempool, "_validate_transaction", lambda self, tx: True)
+    fake_node = SimpleNamespace(mempool=Mempool(), blockchain=None, p2p_network=None)
+    monkeypatch.setitem(app.config, 'node', fake_node)
+    yield fake_node
+    fake_node.mempool.close()
+
+def test_add_transaction_uses_node_mempool(node):
+    client = app.test_client()
+    response = client.post('/transactions', json={
+        "sender": "Alice",
+        "recipient": "Bob",
+        "amount": 10.0,
+        "data": {"note": "api"}
+    })
+
+    assert response.status_code == 201
+    assert response.get_json()['tx_hash'] in node.mempool.transactions
+
+def test_add_transaction_requires_body(node):
+    client = app.test_client()
+    response = client.post('/transactions', json={})
+
+    assert response.status_code == 400
+    assert node.mempool.transactions == {}
@@ -1,6 +1,22 @@
+import time
+from unittest.mock import Mock
 import pytest
-from src.blockchain.mempool import Mempool
+import src.blockchain.mempool as mempool_module
+from src.blockchain.mempool import Mempool, WRITE_BATCH_SIZE
 from src.blockchain.transaction import Transaction
+from src.utils.database import db_connection
+
+@pytest.fixture
+def mempool(clean_db, monkeypatch):
+    """mempool روی دیتابیس تمیز؛ اعتبارسنجی امضا و موجودی در این تست‌ها دور زده می‌شود"""
+    monkeypatch.setattr(Mempool, "_validate_transaction", lambda self, tx: True)
+    pool = Mempool()
+    yield pool
+    pool.close()
+
+def _stored_hashes():
+    with db_connection() as conn:
+        return {row[0] for row in conn.execute("SELECT tx_hash FROM mempool")}
 
 def test_mempool_add_transaction(sample_transaction):
     mempool = Mempool()
@@ -32,4 +48,133 @@ def test_mempool_clear_expired(sample_transaction):
     mempool.add_transaction(tx)
     mempool.clear_expired(expiry_seconds=1)
     
-    assert tx.tx_hash not in mempool.transactions
\ No newline at end of file
+    assert tx.tx_hash not in mempool.transactions
+
+def test_mempool_get_transactions_oldest_first(mempool):
+    txs = [Transaction(sender="A", recipient="B", amount=i, timestamp=1000.0 - i) for i in range(5)]
+    for tx in txs:
+        assert mempool.add_transaction(tx) is True
+
+    # تراکنش حذف شده در heap به صورت تنبل کنار گذاشته می‌شود
+    mempool.remove_transactions([txs[4].tx_hash])
+
+    expected = [txs[3].tx_hash, txs[2].tx_hash, txs[1].tx_hash]
+    assert [tx.tx_hash for tx in mempool.get_transactions(3)] == expected
+    # ورودی‌های انتخاب شده دوباره به heap برمی‌گردند
+    assert [tx.tx_hash for tx in mempool.get_transactions(3)] == expected
+
+def test_mempool_readd_after_removal(mempool):
+    tx = Transaction(sender="A", recipient="B", amount=1)
+    assert mempool.add_transaction(tx) is True
+    mempool.remove_transactions([tx.tx_hash])
+    assert mempool.get_transactions(10) == []
+
+    # ورودی کهنه و ورودی جدید همان تراکنش نباید دو بار انتخاب شوند
+    assert mempool.add_transaction(tx) is True
+    assert [t.tx_hash for t in mempool.get_transactions(10)] == [tx.tx_hash]
+
+def test_mempool_broadcasts_only_accepted_transactions(mempool, monkeypatch):
+    mempool.p2p_network = Mock()
+
+    rejected = Transaction(sender="A", recipient="B", amount=1)
+    monkeypatch.setattr(mempool, "_validate_transaction", lambda tx: False)
+    assert mempool.add_transaction(rejected) is False
+    mempool.p2p_network.broadcast_transaction.assert_not_called()
+
+    accepted = Transaction(sender="A", recipient="B", amount=2)
+    monkeypatch.setattr(mempool, "_validate_transaction", lambda tx: True)
+    assert mempool.add_transaction(accepted) is True
+    mempool.p2p_network.broadcast_transaction.assert_called_once_with(accepted)
+
+def test_mempool_rehydrates_from_database(mempool):
+    txs = [
+        Transaction(sender="A", recipient="B", amount=float(i), data={"note": f"tx {i}"})
+        for i in range(3)
+    ]
+    # مقدار int (همان چیزی که JSON در API می‌دهد)، timestamp صحیح و نوع قرارداد هم باید برگردند
+    txs.append(Transaction(sender="A", recipient="B", amount=10, timestamp=1700000000))
+    txs.append(Transaction(sender="A", recipient="C", amount=5, contract_type="CONTRACT_CALL"))
+    for tx in txs:
+        mempool.add_transaction(tx)
+    mempool.flush()
+
+    restored = Mempool()
+    assert sorted(restored.transactions) == sorted(tx.tx_hash for tx in txs)
+    for tx in txs:
+        assert restored.transactions[tx.tx_hash].data == tx.data
+        assert restored.transactions[tx.tx_hash].contract_type == tx.contract_type
+        assert restored.transactions[tx.tx_hash].calculate_hash() == tx.tx_hash
+    assert [t.tx_hash for t in restored.get_transactions(5)] == [
+        t.tx_hash for t in mempool.get_transactions(5)
+    ]
+    restored.close()
+
+def test_mempool_rehydration_drops_mismatched_rows(mempool):
+    tx = Transaction(sender="A", recipient="B", amount=1.0)
+    mempool.add_transaction(tx)
+    mempool.flush()
+    with db_connection() as conn:
+        conn.execute("UPDATE mempool SET amount = ? WHERE tx_hash = ?", (2.0, tx.tx_hash))
+
+    restored = Mempool()
+    assert restored.transactions == {}
+    restored.close()
+
+def test_mempool_writer_batches_inserts(mempool, monkeypatch):
+    batches = []
+    write_batch = Mempool._write_batch
+    def record(self, batch):
+        batches.append(len(batch))
+        write_batch(self, batch)
+    monkeypatch.setattr(Mempool, "_write_batch", record)
+
+    txs = [Transaction(sender="A", recipient="B", amount=float(i)) for i in range(100)]
+    for tx in txs:
+        mempool.add_transaction(tx)
+    mempool.flush()
+
+    assert _stored_hashes() == {tx.tx_hash for tx in txs}
+    assert sum(batches) == 100
+    assert max(batches) <= WRITE_BATCH_SIZE
+    assert len(batches) < 100
+
+def test_mempool_delete_waits_for_pending_insert(mempool):
+    tx = Transaction(sender="A", recipient="B", amount=1.0)
+    mempool.add_transaction(tx)
+    # درج هنوز در صف است؛ حذف باید پس از نوشته شدن آن انجام شود
+    mempool.remove_transactions([tx.tx_hash])
+    mempool.flush()
+
+    assert _stored_hashes() == set()
+
+def test_mempool_close_drains_queue(mempool):
+    txs = [Transaction(sender="A", recipient="B", amount=float(i)) for i in range(10)]
+    for tx in txs:
+        mempool.add_transaction(tx)
+    mempool.close()
+
+    assert _stored_hashes() == {tx.tx_hash for tx in txs}
+    assert mempool._writer is None
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_mempool_clear_expired_skips_stale_entries(mempool, monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(mempool_module, "np", None)
+
+    now = time.time()
+    old = [Transaction(sender="A", recipient="B", amount=float(i), timestamp=now - 7200) for i in range(4)]
+    fresh = [Transaction(sender="A", recipient="B", amount=float(i), timestamp=now) for i in range(4)]
+    for tx in old + fresh:
+        mempool.add_transaction(tx)
+
+    # ورودی‌های حذف شده در ستون‌ها کهنه می‌مانند؛ یکی دوباره اضافه می‌شود
+    mempool.remove_transactions([old[0].tx_hash, old[1].tx_hash, fresh[0].tx_hash])
+    mempool.add_transaction(old[1])
+
+    mempool.clear_expired(expiry_seconds=3600)
+    mempool.flush()
+
+    assert set(mempool.transactions) == {tx.tx_hash for tx in fresh[1:]}
+    assert _stored_hashes() == {tx.tx_hash for tx in fresh[1:]}
@@ -1,3 +1,4 @@
+import json
 import pytest
 from src.blockchain.transaction import Transaction
 from cryptography.hazmat.primitives.asymmetric import ec
@@ -25,4 +26,49 @@ def test_transaction_signature_verification(sample_transaction):
     
     # دستکاری داده‌ها بعد از امضا
     tx.amount = 20.0
-    assert tx.verify_signature(public_key) is False
\ No newline at end of file
+    assert tx.verify_signature(public_key) is False
+
+
+def test_transaction_hash_cache_invalidated_on_reassignment(sample_transaction):
+    tx = Transaction(**sample_transaction)
+    original = tx.calculate_hash()
+    assert original == tx.tx_hash
+
+    tx.amount = 20.0
+    assert tx.calculate_hash() != original
+
+    tx.amount = 10.0
+    assert tx.calculate_hash() == original
+
+    tx.data = {"note": "changed"}
+    assert tx.calculate_hash() != original
+
+    # tx_hash دریافتی از شبکه بدون محاسبه دوباره نگه داشته می‌شود
+    received = Transaction.from_dict({**tx.to_dict(), "tx_hash": "forged"})
+    assert received.tx_hash == "forged"
+    assert received.calculate_hash() == tx.calculate_hash()
+
+def test_transaction_data_json_compact_and_invalidated(sample_transaction):
+    tx = Transaction(**{**sample_transaction, "data": {"b": 1, "a": "سلام"}})
+    assert tx.data_json == '{"a":"سلام","b":1}'
+    assert json.loads(tx.data_json) == tx.data
+
+    tx.data = {"c": [1, 2]}
+    assert tx.data_json == '{"c":[1,2]}'
+
+@pytest.mark.parametrize("data", [
+    {"big": 10 ** 20},
+    {"nan": float("nan"), "inf": float("inf")},
+    {"float": 1e16, "small": 1e-7, "neg": -0.5},
+    {"nested": {"list": [1, 2.5, None, True, "ü"]}, "tuple": (1, 2)},
+    {1: "int key", 2: "another int key"},
+])
+def test_transaction_data_json_round_trips_edge_values(sample_transaction, data):
+    tx = Transaction(**{**sample_transaction, "data": data})
+    stored = tx.data_json
+
+    assert stored == json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    # بازخوانی ردیف ذخیره شده همان هش را می‌سازد
+    restored = Transaction(**{**sample_transaction, "data": json.loads(stored),
+                              "timestamp": tx.timestamp})
+    assert restored.calculate_hash() == tx.calculate_hash()